@@ -3,47 +3,29 @@ Finite‑state machine regex engine
 Nikita Lenyk
 """
 
-from abc import ABC, ABCMeta, abstractmethod
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections.abc import Callable
+from functools import lru_cache
+from itertools import chain, filterfalse, islice
 
+_MAX_CODE = 0x110000
 
-class StateMeta(ABCMeta):
-    """
-    Metaclass for State class. It adds the __mul__ method to the State class.
-    """
-
-    def __new__(mcs: type, name: str, bases: tuple, namespace: dict):
-        """
-        This method is called when a new class is created.
-        Adds the __mul__method into namespace of the class.
-
-        Args:
-            mcs (type): metaclass
-            name (str): name of the class
-            bases (tuple): tuple of base classes
-            namespace (dict): namespace of the class
-        """
-
-        def __mul__(self, _other: "State") -> "State":
-            """
-            This method is called when the * operator is used on a State object.
-
-            Args:
-                _other (State): unused argument
-
-            Returns:
-                State: a new StarState object
-            """
-            return StarState(self)
 
-        namespace["__mul__"] = __mul__
-        return super().__new__(mcs, name, bases, namespace)
-
-
-class State(ABC, metaclass=StateMeta):
+class State(ABC):
     """
     Base class for all states.
     """
 
+    __slots__ = (
+        "is_final",
+        "next_states",
+        "_idx",
+        "_ascii_next",
+        "_class_next",
+        "_dot_next",
+    )
+
     def __init__(self) -> None:
         self.is_final: bool = False
         self.next_states: list["State"] = []
@@ -61,23 +43,33 @@ class State(ABC, metaclass=StateMeta):
         """
         pass
 
-    def check_next(self, next_char: str) -> "State":
+    def check_next(self, next_char: str) -> "State | None":
         """
         Check the next character and return the next state.
 
         Args:
             next_char (str): the next character to check
 
-        Raises:
-            NotImplementedError: if the next character is not accepted by any state
-
         Returns:
-            State: a state that accepts the next character
+            State | None: a state that accepts the next character, or None if
+            the character is not accepted by any state
         """
         for state in self.next_states:
             if state.check_self(next_char):
                 return state
-        raise NotImplementedError("rejected string")
+        return None
+
+    def __mul__(self, _other: "State") -> "State":
+        """
+        This method is called when the * operator is used on a State object.
+
+        Args:
+            _other (State): unused argument
+
+        Returns:
+            State: a new StarState object
+        """
+        return StarState(self)
 
     def __repr__(self) -> str:
         """
@@ -94,6 +86,8 @@ class StartState(State):
     Start state of the FSM. It is the first state in the FSM.
     """
 
+    __slots__ = ()
+
     def check_self(self, _: str) -> bool:
         """
         Override the check_self method to always return False.
@@ -112,6 +106,8 @@ class TerminationState(State):
     Termination state of the FSM. It is the last state in the FSM.
     """
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__()
         self.is_final = True
@@ -134,6 +130,8 @@ class DotState(State):
     Dot state of the FSM. It accepts any character.
     """
 
+    __slots__ = ()
+
     def check_self(self, _: str) -> bool:
         """
         Override the check_self method to always return True.
@@ -152,6 +150,8 @@ class AsciiState(State):
     Ascii state of the FSM. It accepts a single character.
     """
 
+    __slots__ = ("symbol",)
+
     def __init__(self, symbol: str) -> None:
         super().__init__()
         self.symbol = symbol
@@ -181,24 +181,96 @@ class AsciiState(State):
 class ClassState(State):
     """
     CharClassState is a state that accepts a set of characters.
+
+    The characters are stored as code points. _bounds lists the code points
+    where membership switches on or off, in increasing order.
     """
 
-    def __init__(self, chars: set[str], ignore: bool = False) -> None:
+    __slots__ = ("chars", "ignore", "_lo", "_hi", "_ascii", "_bounds")
+
+    def __init__(self, chars: set[int] | frozenset[int], ignore: bool = False) -> None:
+        ranges: list[range] = []
+        for code in sorted(chars):
+            if ranges and ranges[-1].stop == code:
+                ranges[-1] = range(ranges[-1].start, code + 1)
+            else:
+                ranges.append(range(code, code + 1))
+        self._setup(ranges, ignore)
+
+    @classmethod
+    def from_ranges(cls, ranges: list[range], ignore: bool = False) -> "ClassState":
+        """
+        Create a class state from the code point ranges of a parsed class.
+
+        The code points are taken from the ranges directly, so the cost grows
+        with the size of the class, not with its largest code point.
+
+        Args:
+            ranges (list[range]): code point ranges of the class
+            ignore (bool): True for a negated class
+
+        Returns:
+            ClassState: the new state
+        """
+        state = cls.__new__(cls)
+        state._setup(ranges, ignore)
+        return state
+
+    def _setup(self, ranges: list[range], ignore: bool) -> None:
+        """
+        Set every field of the state from the code point ranges of its class.
+
+        Both __init__ and from_ranges go through here. The ASCII bitset is
+        built one shifted block of ones per range.
+
+        Args:
+            ranges (list[range]): code point ranges of the class
+            ignore (bool): True for a negated class
+        """
         super().__init__()
-        self.chars = chars
-        self.ignore = ignore
+
+        mask = 0
+        bounds: list[int] = []
+        for r in sorted(filter(None, ranges), key=lambda r: r.start):
+            hi = min(r.stop, 128)
+            if r.start < hi:
+                mask |= ((1 << (hi - r.start)) - 1) << r.start
+            if bounds and r.start <= bounds[-1]:
+                bounds[-1] = max(bounds[-1], r.stop)
+            else:
+                bounds += [r.start, r.stop]
+
+        self.chars = frozenset(chain.from_iterable(ranges))
+        self.ignore = int(ignore)
+        self._ascii = all(r.stop <= 128 for r in ranges if r)
+        self._lo = mask & ((1 << 64) - 1)
+        self._hi = mask >> 64
+        self._bounds = tuple(bounds)
 
     def check_self(self, char: str) -> bool:
         """
         Check if the character is in the set of characters.
 
+        ASCII-only classes are stored as two 64-bit masks, so membership is a
+        shift and a bit test instead of a hash lookup.
+
         Args:
             char (str): the character to check
 
         Returns:
             bool: True if the character is in the set, False otherwise
         """
-        return char not in self.chars if self.ignore else char in self.chars
+        if not self._ascii:
+            return (ord(char) in self.chars) != self.ignore
+
+        code = ord(char)
+        if code < 64:
+            hit = (self._lo >> code) & 1
+        elif code < 128:
+            hit = (self._hi >> (code - 64)) & 1
+        else:
+            hit = 0
+        return bool(hit ^ self.ignore)
 
     def __repr__(self) -> str:
         """
@@ -208,7 +280,7 @@ class ClassState(State):
             str: string representation of the state
         """
         prefix = "^" if self.ignore else ""
-        chars = "".join(sorted(self.chars))
+        chars = "".join(map(chr, sorted(self.chars)))
         return f"CharClassState('{prefix}[{chars}]', final={self.is_final})"
 
 
@@ -217,6 +289,8 @@ class StarState(State):
     StarState is a state that accepts zero or more occurrences of the base state.
     """
 
+    __slots__ = ("base",)
+
     def __init__(self, base: State) -> None:
         super().__init__()
         self.base = base
@@ -234,7 +308,7 @@ class StarState(State):
         """
         return self.base.check_self(char)
 
-    def check_next(self, next_char: str) -> "State":
+    def check_next(self, next_char: str) -> "State | None":
         """
         Check the next character and return the next state.
 
@@ -242,7 +316,8 @@ class StarState(State):
             next_char (str): the next character to check
 
         Returns:
-            State: a state that accepts the next character
+            State | None: a state that accepts the next character, or None if
+            the character is not accepted by any state
         """
         if self.check_self(next_char):
             return self
@@ -254,10 +329,17 @@ class RegexFSM:
     FSM builder for regex patterns.
     """
 
+    _DFA_CACHE_SIZE = 4096
+    _TABLE_MAX_STATES = 256
+    _TABLE_MAX_INTERVALS = 256
+    _MATCHER_MAX_SET = 256
+
     def __init__(self, regex_pattern: str) -> None:
         self.regex_pattern = regex_pattern
         self.start_state = StartState()
 
+        class_ends = self._scan_classes(regex_pattern)
+
         prev_state: State = self.start_state
         prev_prev_state: State | None = None
 
@@ -266,44 +348,45 @@ class RegexFSM:
             char = regex_pattern[i]
 
             match char:
-                case "*" | "+":
+                case "*":
                     star_state = prev_state * None
 
-                    if char == "*" and RegexFSM.star_followed_by_charclass_plus(
-                        regex_pattern, i
-                    ):
+                    if RegexFSM.star_followed_by_charclass_plus(regex_pattern, i):
                         star_state.is_final = False
 
-                    if char == "*":
-                        edge_from = prev_prev_state or self.start_state
-                        edge_from.next_states.append(star_state)
+                    edge_from = prev_prev_state or self.start_state
+                    edge_from.next_states.append(star_state)
 
                     prev_state.next_states.append(star_state)
                     prev_prev_state, prev_state = prev_state, star_state
                     i += 1
 
+                case "+":
+                    # The base state is the required first occurrence; the only
+                    # edges added are base -> loop and the loop's own self-loop.
+                    star_state = prev_state * None
+                    prev_state.next_states.append(star_state)
+                    prev_prev_state, prev_state = prev_state, star_state
+                    i += 1
+
                 case "[":
-                    j = regex_pattern.find("]", i + 1)
-                    if j == -1:
-                        raise ValueError("Unclosed character class")
-
-                    content = regex_pattern[i + 1 : j]
-                    ignore = content.startswith("^")
-                    if ignore:
-                        content = content[1:]
-
-                    chars: set[str] = set()
-                    k = 0
-                    while k < len(content):
-                        if k + 2 < len(content) and content[k + 1] == "-":
-                            for code in range(ord(content[k]), ord(content[k + 2]) + 1):
-                                chars.add(chr(code))
+                    j = class_ends[i]
+                    ignore = regex_pattern.startswith("^", i + 1, j)
+                    start = i + 2 if ignore else i + 1
+
+                    ranges: list[range] = []
+                    k = start
+                    while k < j:
+                        if k + 2 < j and regex_pattern[k + 1] == "-":
+                            lo, hi = ord(regex_pattern[k]), ord(regex_pattern[k + 2])
+                            ranges.append(range(lo, hi + 1))
                             k += 3
                         else:
-                            chars.add(content[k])
+                            code = ord(regex_pattern[k])
+                            ranges.append(range(code, code + 1))
                             k += 1
 
-                    state = ClassState(chars, ignore)
+                    state = ClassState.from_ranges(ranges, ignore)
                     prev_state.next_states.append(state)
                     prev_prev_state, prev_state = prev_state, state
                     i = j + 1
@@ -320,6 +403,51 @@ class RegexFSM:
                     i += 1
 
         prev_state.next_states.append(TerminationState())
+        self._precompute_transitions()
+        self._build_dfa()
+        self._detect_literal_prefix()
+        self._matcher: Callable[[str], bool] | None = None
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def compile(cls, pattern: str) -> "RegexFSM":
+        """
+        Build the FSM for a pattern, reusing the instance from an earlier call.
+
+        The returned FSM is shared by every caller that compiles the same
+        pattern, so it must not be mutated.
+
+        Args:
+            pattern (str): regex pattern to compile
+
+        Returns:
+            RegexFSM: the FSM for the pattern
+        """
+        return cls(pattern)
+
+    @staticmethod
+    def _scan_classes(expr: str) -> dict[int, int]:
+        """
+        Locate every character class in the expression in a single pass.
+
+        Args:
+            expr (str): expression to scan
+
+        Raises:
+            ValueError: if a character class is not closed
+
+        Returns:
+            dict[int, int]: index of each "[" mapped to the index of its "]"
+        """
+        class_ends: dict[int, int] = {}
+        i = expr.find("[")
+        while i != -1:
+            j = expr.find("]", i + 1)
+            if j == -1:
+                raise ValueError("Unclosed character class")
+            class_ends[i] = j
+            i = expr.find("[", j + 1)
+        return class_ends
 
     @staticmethod
     def star_followed_by_charclass_plus(expr: str, star_idx: int) -> bool:
@@ -340,44 +468,490 @@ class RegexFSM:
         j = expr.find("]", star_idx + 2)
         return j != -1 and j + 1 < len(expr) and expr[j + 1] == "+"
 
+    def _reachable_states(self) -> list[State]:
+        """
+        Collect every state reachable from the start state.
+
+        Returns:
+            list[State]: reachable states in discovery order
+        """
+        seen = {id(self.start_state)}
+        states = [self.start_state]
+        for state in states:
+            for next_state in state.next_states:
+                if id(next_state) not in seen:
+                    seen.add(id(next_state))
+                    states.append(next_state)
+        return states
+
+    def _step(self, mask: int, char: str) -> int:
+        """
+        Advance a set of NFA states by one character.
+
+        Args:
+            mask (int): active states as a bitmask over state indices
+            char (str): the character to consume
+
+        Returns:
+            int: active states after consuming the character
+        """
+        states, star_expand = self._states, self._star_expand
+
+        active = mask
+        while active:
+            bit = active & -active
+            mask |= star_expand[bit.bit_length() - 1]
+            active ^= bit
+
+        next_mask = 0
+        while mask:
+            bit = mask & -mask
+            state = states[bit.bit_length() - 1]
+            nxt = state._ascii_next.get(char)
+            if nxt is None:
+                for other in state._class_next:
+                    if other.check_self(char):
+                        nxt = other
+                        break
+                else:
+                    nxt = state._dot_next
+            if nxt is not None:
+                next_mask |= 1 << nxt._idx
+            mask ^= bit
+        return next_mask
+
+    def _precompute_transitions(self) -> None:
+        """
+        Index the reachable states and cache their transition data as bitmasks.
+
+        For every state index this records the star-final successors promoted
+        before each step. Each state also gets its candidates split the way
+        check_next would resolve them: _ascii_next maps every symbol of its
+        AsciiState successors to the state check_next would pick for it,
+        _class_next lists the other candidates that test the character, in
+        check_next order, and _dot_next is the first candidate accepting any
+        character, used as the fallback. Candidates after _dot_next can never
+        be picked.
+
+        _accept_mask marks the states that accept at the end of the input:
+        final states and states with a final successor. The end-of-input check
+        is then a single AND.
+        """
+        self._states = self._reachable_states()
+        for idx, state in enumerate(self._states):
+            state._idx = idx
+
+        self._accept_mask = 0
+        self._star_expand: list[int] = []
+        for state in self._states:
+            if state.is_final or any(ns.is_final for ns in state.next_states):
+                self._accept_mask |= 1 << state._idx
+
+            star_expand = 0
+            for ns in state.next_states:
+                if isinstance(ns, StarState) and ns.is_final:
+                    star_expand |= 1 << ns._idx
+            self._star_expand.append(star_expand)
+
+            candidates = list(state.next_states)
+            if isinstance(state, StarState):
+                candidates.insert(0, state)
+            state._class_next = []
+            state._dot_next = None
+            for ns in candidates:
+                base = ns
+                while isinstance(base, StarState):
+                    base = base.base
+                if isinstance(base, DotState):
+                    state._dot_next = ns
+                    break
+                if not isinstance(ns, (AsciiState, StartState, TerminationState)):
+                    state._class_next.append(ns)
+
+            state._ascii_next = {}
+            for ns in candidates:
+                if isinstance(ns, AsciiState) and ns.symbol not in state._ascii_next:
+                    state._ascii_next[ns.symbol] = next(
+                        c for c in candidates if c.check_self(ns.symbol)
+                    )
+
+    def _build_dfa(self) -> None:
+        """
+        Prepare the lazily built DFA used by check_string.
+
+        DFA states are NFA state bitmasks and their rows are filled in on first
+        use by _expand, so pathological patterns never pay for the full subset
+        construction. The code points are split into intervals at the symbols
+        and the class boundaries of the pattern. Every state treats all
+        characters of an interval alike, so rows hold one transition per
+        interval, computed from its first character, and _bounds lists the
+        first code point of every interval.
+        """
+        bounds = {0}
+        for state in self._states:
+            if isinstance(state, AsciiState):
+                code = ord(state.symbol)
+                bounds.update((code, code + 1))
+            elif isinstance(state, ClassState):
+                bounds.update(state._bounds)
+        bounds.discard(_MAX_CODE)
+        self._bounds = sorted(bounds)
+        ends = self._bounds[1:] + [_MAX_CODE]
+        self._spans = [range(lo, hi) for lo, hi in zip(self._bounds, ends)]
+
+        self._dtable: dict[int, list[int]] = {}
+
+    def _expand(self, mask: int) -> list[int]:
+        """
+        Compute and cache the DFA row for a set of NFA states.
+
+        The cache is cleared once it holds _DFA_CACHE_SIZE rows, which bounds
+        memory on patterns whose subset construction blows up.
+
+        Args:
+            mask (int): active states as a bitmask over state indices
+
+        Returns:
+            list[int]: next mask for every interval of _bounds
+        """
+        if len(self._dtable) >= self._DFA_CACHE_SIZE:
+            self._dtable.clear()
+
+        row = [self._step(mask, chr(lo)) for lo in self._bounds]
+        self._dtable[mask] = row
+        return row
+
+    def _detect_literal_prefix(self) -> None:
+        """
+        Find the literal characters every accepted string must start with.
+
+        The prefix is the chain of single AsciiState successors leading out of
+        the start state. If that chain runs all the way to the termination
+        state the whole pattern is a literal and is matched with a plain string
+        comparison.
+        """
+        state: State = self.start_state
+        symbols: list[str] = []
+        while len(state.next_states) == 1 and isinstance(
+            state.next_states[0], AsciiState
+        ):
+            state = state.next_states[0]
+            symbols.append(state.symbol)
+
+        self._prefix = "".join(symbols)
+        self._prefix_mask = 1 << state._idx
+
+        self._is_literal = len(state.next_states) == 1 and isinstance(
+            state.next_states[0], TerminationState
+        )
+
+    def _check_literal(self, text: str) -> bool:
+        """
+        Check a string against a pattern made of plain characters only.
+
+        Args:
+            text (str): string to check
+
+        Returns:
+            bool: True if the string equals the pattern, False otherwise
+        """
+        return text == self._prefix
+
+    def _compile_table(self) -> Callable[[str], bool] | None:
+        """
+        Build the full DFA reachable after the literal prefix and compile it.
+
+        Each DFA state gets a row with one entry per interval of _bounds,
+        holding the number of the next state or -1 for the dead state. The
+        start state is state 0. The table is pruned, minimized and turned into
+        a generated matcher.
+
+        Returns:
+            Callable[[str], bool] | None: the generated matcher, or None if
+            the DFA has more than _TABLE_MAX_STATES states or the pattern more
+            than _TABLE_MAX_INTERVALS intervals
+        """
+        if len(self._bounds) > self._TABLE_MAX_INTERVALS:
+            return None
+
+        numbers: dict[int, int] = {self._prefix_mask: 0}
+        masks = [self._prefix_mask]
+        table: list[list[int]] = []
+        for mask in masks:
+            row = self._dtable.get(mask)
+            if row is None:
+                row = self._expand(mask)
+            entries: list[int] = []
+            for nxt in row:
+                if not nxt:
+                    entries.append(-1)
+                    continue
+                if nxt not in numbers:
+                    if len(masks) == self._TABLE_MAX_STATES:
+                        return None
+                    numbers[nxt] = len(masks)
+                    masks.append(nxt)
+                entries.append(numbers[nxt])
+            table.append(entries)
+
+        final = [bool(mask & self._accept_mask) for mask in masks]
+        self._prune_dead_rows(table, final)
+        table, final = self._minimize_table(table, final)
+        return self._generate_matcher(table, final)
+
+    @staticmethod
+    def _prune_dead_rows(table: list[list[int]], final: list[bool]) -> None:
+        """
+        Redirect transitions into DFA states that can never accept to -1.
+
+        Every NFA state can reach the termination state, but the first-match
+        rule of check_next can produce DFA states from which no accepting
+        state is reachable. Pointing at -1 instead lets the matcher reject as
+        soon as the input enters one.
+
+        Args:
+            table (list[list[int]]): DFA rows, updated in place
+            final (list[bool]): accepting flag per DFA state
+        """
+        predecessors: list[set[int]] = [set() for _ in final]
+        for s, row in enumerate(table):
+            for target in row:
+                if target >= 0:
+                    predecessors[target].add(s)
+
+        live = {s for s, accepting in enumerate(final) if accepting}
+        frontier = list(live)
+        while frontier:
+            for s in predecessors[frontier.pop()] - live:
+                live.add(s)
+                frontier.append(s)
+
+        for row in table:
+            for pos, target in enumerate(row):
+                if target >= 0 and target not in live:
+                    row[pos] = -1
+
+    @staticmethod
+    def _minimize_table(
+        table: list[list[int]], final: list[bool]
+    ) -> tuple[list[list[int]], list[bool]]:
+        """
+        Merge equivalent states of a DFA.
+
+        States start out split by whether they accept and the partition is
+        refined by the blocks their rows lead to until it stops splitting, as
+        in Moore's minimization. Distinct NFA state sets often behave the same
+        (for instance when they differ only in states that can never advance),
+        so this typically removes about half of the rows.
+
+        Args:
+            table (list[list[int]]): DFA rows
+            final (list[bool]): accepting flag per DFA state
+
+        Returns:
+            tuple[list[list[int]], list[bool]]: the minimized rows and final
+            flags, with the start state still at 0
+        """
+        block = [int(f) for f in final]
+        n_blocks = len(set(block))
+        while True:
+            signatures: dict[tuple, int] = {}
+            block = [
+                signatures.setdefault(
+                    (block[s], tuple(block[t] if t >= 0 else -1 for t in row)),
+                    len(signatures),
+                )
+                for s, row in enumerate(table)
+            ]
+            if len(signatures) == n_blocks:
+                break
+            n_blocks = len(signatures)
+
+        representative: dict[int, int] = {}
+        for s, b in enumerate(block):
+            representative.setdefault(b, s)
+
+        minimized = [
+            [block[t] if t >= 0 else -1 for t in table[s]]
+            for s in representative.values()
+        ]
+        return minimized, [final[s] for s in representative.values()]
+
+    def _generate_matcher(
+        self, table: list[list[int]], final: list[bool]
+    ) -> Callable[[str], bool]:
+        """
+        Generate and compile a Python function that runs the DFA.
+
+        Every DFA state becomes its own loop over the input, picked by a
+        binary search on the state number so that a state change costs a
+        logarithmic number of comparisons. The target
+        covering the most code points becomes the "else" branch. Characters
+        the state loops on are skipped by filter/filterfalse without entering
+        the loop body, characters leading elsewhere set the next state and
+        break out to the dispatch, and the end of the input returns whether
+        the state accepts. Small sets of characters are written as set
+        displays, which CPython turns into frozenset constants, and larger
+        ones as range comparisons.
+
+        Args:
+            table (list[list[int]]): minimized DFA rows indexed by interval
+            final (list[bool]): accepting flag per DFA state
+
+        Returns:
+            Callable[[str], bool]: the generated matcher
+        """
+        spans = self._spans
+
+        def chars(group: list[int]) -> list[str]:
+            return [chr(code) for i in group for code in spans[i]]
+
+        def condition(group: list[int]) -> str:
+            if sum(len(spans[i]) for i in group) > self._MATCHER_MAX_SET:
+                return " or ".join(
+                    f"{chr(spans[i][0])!r} <= c <= {chr(spans[i][-1])!r}" for i in group
+                )
+            group_chars = chars(group)
+            if len(group_chars) == 1:
+                return f"c == {group_chars[0]!r}"
+            return f"c in {{{', '.join(map(repr, group_chars))}}}"
+
+        def action(s: int, target: int) -> list[str]:
+            if target == s:
+                return ["continue"]
+            if target < 0:
+                return ["return False"]
+            return [f"s = {target}", "break"]
+
+        lines = ["def match(text):"]
+        if self._prefix:
+            lines += [
+                f"    if not text.startswith({self._prefix!r}):",
+                "        return False",
+                f"    it = iter(text[{len(self._prefix)}:])",
+            ]
+        else:
+            lines.append("    it = iter(text)")
+        lines += ["    s = 0", "    while True:"]
+
+        namespace: dict[str, object] = {"filter": filter, "filterfalse": filterfalse}
+        bodies: list[list[str]] = []
+        for s, row in enumerate(table):
+            weight: dict[int, int] = {}
+            for target, span in zip(row, spans):
+                weight[target] = weight.get(target, 0) + len(span)
+            fallback = max(weight, key=weight.__getitem__)
+
+            groups: dict[int, list[int]] = {}
+            for i, target in enumerate(row):
+                if target != fallback:
+                    groups.setdefault(target, []).append(i)
+
+            source = "it"
+            if fallback == s:
+                skip = [i for i, target in enumerate(row) if target != s]
+            else:
+                skip = groups.get(s)
+            if skip is not None and (
+                sum(len(spans[i]) for i in skip) <= self._MATCHER_MAX_SET
+            ):
+                namespace[f"_S{s}"] = frozenset(chars(skip))
+                source = "filter" if fallback == s else "filterfalse"
+                source = f"{source}(_S{s}.__contains__, it)"
+                groups.pop(s, None)
+
+            body = [f"for c in {source}:"]
+            keyword = "if"
+            for target, group in groups.items():
+                body.append(f"    {keyword} {condition(group)}:")
+                body += [f"        {line}" for line in action(s, target)]
+                keyword = "elif"
+            if groups:
+                body.append("    else:")
+                body += [f"        {line}" for line in action(s, fallback)]
+            else:
+                body += [f"    {line}" for line in action(s, fallback)]
+            body += ["else:", f"    return {final[s]}"]
+            bodies.append(body)
+
+        def dispatch(lo: int, hi: int, indent: str) -> None:
+            if hi - lo == 1:
+                lines.extend(indent + line for line in bodies[lo])
+                return
+            mid = (lo + hi) // 2
+            lines.append(f"{indent}if s < {mid}:")
+            dispatch(lo, mid, indent + "    ")
+            lines.append(f"{indent}else:")
+            dispatch(mid, hi, indent + "    ")
+
+        dispatch(0, len(bodies), "        ")
+        exec(compile("\n".join(lines), "<regex>", "exec"), namespace)
+        return namespace["match"]
+
     def check_string(self, text: str) -> bool:
         """
         Check if the string is accepted by the FSM.
 
+        The matcher is picked on the first call, so building an FSM stays
+        cheap: literal patterns compare strings, other patterns use the
+        generated matcher, and patterns too large for it walk the lazy DFA.
+
+        Args:
+            text (str): string to check
+
+        Returns:
+            bool: True if the string is accepted by the FSM, False otherwise
+        """
+        matcher = self._matcher
+        if matcher is None:
+            if self._is_literal:
+                matcher = self._check_literal
+            else:
+                matcher = self._compile_table() or self._check_lazy
+            self._matcher = matcher
+        return matcher(text)
+
+    def _check_lazy(self, text: str) -> bool:
+        """
+        Check a string by walking the lazily built DFA.
+
         Args:
             text (str): string to check
 
         Returns:
             bool: True if the string is accepted by the FSM, False otherwise
         """
-        current: set[State] = {self.start_state}
-        for char in text:
-            current |= {
-                next_state
-                for state in current
-                for next_state in state.next_states
-                if isinstance(next_state, StarState) and next_state.is_final
-            }
-            next_states: set[State] = set()
-            for st in current:
-                try:
-                    next_states.add(st.check_next(char))
-                except NotImplementedError:
-                    pass
-            if not next_states:
+        prefix = self._prefix
+        if not text.startswith(prefix):
+            return False
+
+        dtable, bounds = self._dtable, self._bounds
+        m = self._prefix_mask
+        for c in islice(text, len(prefix), None):
+            row = dtable.get(m)
+            if row is None:
+                row = self._expand(m)
+            m = row[bisect_right(bounds, ord(c)) - 1]
+            if not m:
                 return False
-            current = next_states
+        return bool(m & self._accept_mask)
 
-        current |= {
-            next_state
-            for state in current
-            for next_state in state.next_states
-            if next_state.is_final
-        }
-        return any(state.is_final for state in current)
+    def __getstate__(self) -> dict:
+        """
+        Return the state to pickle, leaving out the generated matcher.
+
+        Returns:
+            dict: instance attributes, with the matcher reset so that it is
+            rebuilt on the first check after unpickling
+        """
+        state = self.__dict__.copy()
+        state["_matcher"] = None
+        return state
 
 
 if __name__ == "__main__":
+    import pickle
+
     fsm = RegexFSM("a*b")
     assert fsm.check_string("b") is True
     assert fsm.check_string("aaaab") is True
@@ -444,3 +1018,48 @@ if __name__ == "__main__":
     assert fsm3.check_string("##")
     assert not fsm3.check_string("abc")
     assert not fsm3.check_string("aZ")
+
+    fsm4 = RegexFSM("[一-龥]+x")
+    assert fsm4.check_string("中文x")
+    assert not fsm4.check_string("ax")
+    assert not fsm4.check_string("x")
+
+    fsm5 = RegexFSM("[\x00-\U0010ffff]*")
+    assert fsm5.check_string("")
+    assert fsm5.check_string("a中\U0001f600")
+    assert not RegexFSM("[^\x00-\U0010ffff]").check_string("a")
+
+    # Too many intervals for the generated matcher, so the lazy DFA is used.
+    pattern6 = "[" + "".join(map(chr, range(0x100, 0x300, 2))) + "]+x"
+    fsm6 = RegexFSM(pattern6)
+    assert fsm6.check_string("\u0100\u02fex")
+    assert not fsm6.check_string("\u0101x")
+    assert not fsm6.check_string("x")
+    assert fsm6._matcher == fsm6._check_lazy
+
+    # A long chain of states still goes through the generated matcher.
+    fsm8 = RegexFSM("[a-z]" * 200)
+    assert fsm8.check_string("q" * 200)
+    assert not fsm8.check_string("q" * 199)
+    assert not fsm8.check_string("q" * 199 + "1")
+    assert not fsm8.check_string("q" * 201)
+    assert fsm8._matcher != fsm8._check_lazy
+
+    fsm7 = pickle.loads(pickle.dumps(fsm1))
+    assert fsm7.check_string("abcddggg")
+    assert not fsm7.check_string("xyz")
+
+    assert RegexFSM.compile("a*b") is RegexFSM.compile("a*b")
+    compiled = RegexFSM.compile(pattern2)
+    for text in ("shs123", "abcm@#", "shtT", "shshabc", ""):
+        assert compiled.check_string(text) == fsm2.check_string(text)
+
+    cached = RegexFSM.compile.cache_info().currsize
+    for _ in range(2):
+        try:
+            RegexFSM.compile("[a")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("unclosed class was accepted")
+    assert RegexFSM.compile.cache_info().currsize == cached
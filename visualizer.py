@@ -34,7 +34,7 @@ class FSMVisualizer:
             raise ValueError("Either fsm or pattern must be provided.")
 
         if fsm is None:
-            self.fsm = RegexFSM(pattern)
+            self.fsm = RegexFSM.compile(pattern)
             self.pattern = pattern
         else:
             self.fsm = fsm
@@ -56,12 +56,31 @@ class FSMVisualizer:
 
         self.visited_states = set()
         self.edges = set()
+        self._label_cache: dict[int, str] = {}
+        self._edge_label_cache: dict[tuple[int, int], str] = {}
+        self._sorted_chars: dict[int, str] = {}
 
     def _get_state_id(self, state: State) -> str:
         """Get a unique ID for a state."""
         return f"state_{id(state)}"
 
+    def _get_class_chars(self, state: ClassState) -> str:
+        """Get the sorted characters of a class state, computed once per state."""
+        chars = self._sorted_chars.get(id(state))
+        if chars is None:
+            chars = "".join(map(chr, sorted(state.chars)))
+            self._sorted_chars[id(state)] = chars
+        return chars
+
     def _get_state_label(self, state: State) -> str:
+        """Get a human-readable label for a state, cached by state identity."""
+        label = self._label_cache.get(id(state))
+        if label is None:
+            label = self._make_state_label(state)
+            self._label_cache[id(state)] = label
+        return label
+
+    def _make_state_label(self, state: State) -> str:
         """Get a human-readable label for a state."""
         if isinstance(state, StartState):
             return "Start"
@@ -73,7 +92,7 @@ class FSMVisualizer:
             return "."
         elif isinstance(state, ClassState):
             prefix = "^" if state.ignore else ""
-            chars = "".join(sorted(state.chars))
+            chars = self._get_class_chars(state)
             return f"[{prefix}{chars}]"
         elif isinstance(state, StarState):
             base_label = self._get_state_label(state.base)
@@ -82,6 +101,15 @@ class FSMVisualizer:
             return state.__class__.__name__
 
     def _get_transition_label(self, state: State, next_state: State) -> str:
+        """Get a label for a transition, cached by the identities of both states."""
+        key = (id(state), id(next_state))
+        label = self._edge_label_cache.get(key)
+        if label is None:
+            label = self._make_transition_label(state, next_state)
+            self._edge_label_cache[key] = label
+        return label
+
+    def _make_transition_label(self, state: State, next_state: State) -> str:
         """Get a label for a transition between two states."""
         if isinstance(next_state, AsciiState):
             return next_state.symbol
@@ -89,7 +117,7 @@ class FSMVisualizer:
             return "."
         elif isinstance(next_state, ClassState):
             prefix = "^" if next_state.ignore else ""
-            chars = "".join(sorted(next_state.chars))
+            chars = self._get_class_chars(next_state)
             if len(chars) > 10:
                 # Truncate long character classes
                 chars = chars[:5] + "..." + chars[-2:]
@@ -105,7 +133,7 @@ class FSMVisualizer:
                     return "."
                 elif isinstance(state.base, ClassState):
                     prefix = "^" if state.base.ignore else ""
-                    chars = "".join(sorted(state.base.chars))
+                    chars = self._get_class_chars(state.base)
                     if len(chars) > 10:
                         chars = chars[:5] + "..." + chars[-2:]
                     return f"[{prefix}{chars}]"
@@ -139,10 +167,14 @@ class FSMVisualizer:
 
         return style
 
-    def _build_graph(self, state: State, parent_id: str = None):
-        """Recursively build the graph from a state."""
-        state_id = self._get_state_id(state)
-        if state_id not in self.visited_states:
+    def _build_graph(self, start_state: State):
+        """Build the graph from a state using an explicit stack."""
+        stack = [start_state]
+        while stack:
+            state = stack.pop()
+            state_id = self._get_state_id(state)
+            if state_id in self.visited_states:
+                continue
             self.visited_states.add(state_id)
             label = self._get_state_label(state)
             style = self._get_state_style(state)
@@ -154,19 +186,13 @@ class FSMVisualizer:
                     self.edges.add(edge_key)
                     transition_label = self._get_transition_label(state, next_state)
                     self.dot.edge(state_id, next_id, label=transition_label)
-                self._build_graph(next_state)
-        if parent_id is not None:
-            edge_key = (parent_id, state_id)
-            if edge_key not in self.edges:
-                self.edges.add(edge_key)
-                transition_label = self._get_transition_label(None, state)
-                self.dot.edge(parent_id, state_id, label=transition_label)
-        if isinstance(state, StarState):
-            edge_key = (state_id, state_id)
-            if edge_key not in self.edges:
-                self.edges.add(edge_key)
-                loop_label = self._get_transition_label(state, state)
-                self.dot.edge(state_id, state_id, label=loop_label)
+            stack.extend(reversed(state.next_states))
+            if isinstance(state, StarState):
+                edge_key = (state_id, state_id)
+                if edge_key not in self.edges:
+                    self.edges.add(edge_key)
+                    loop_label = self._get_transition_label(state, state)
+                    self.dot.edge(state_id, state_id, label=loop_label)
 
     def visualize(
         self, output_path: str = None, view: bool = True, format: str = "png"